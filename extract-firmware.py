@@ -8,21 +8,90 @@ import os
 import sys
 import shutil
 import argparse
+import functools
 import glob
 import hashlib
+import mmap
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+MY_DIR = os.path.dirname(os.path.abspath(__file__))
+ANDROID_ROOT = os.path.abspath(f"{MY_DIR}/../../..")
+
+AB_OTA_PARTITIONS_RE = re.compile(r'AB_OTA_PARTITIONS \+= \\(.*?)(?=\n\n|\n[^\s]|\Z)', re.DOTALL)
+AB_OTA_ENTRY_RE = re.compile(r'[^\s\\]+')
+
 def calculate_sha1(file_path):
     """Calculate SHA1 checksum for a file"""
-    sha1 = hashlib.sha1()
     with open(file_path, 'rb') as f:
-        while True:
-            data = f.read(65536)  # Read in 64k chunks
-            if not data:
-                break
-            sha1.update(data)
-    return sha1.hexdigest()
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha1').hexdigest()
+
+        # Empty files can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha1().hexdigest()
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return hashlib.sha1(mm).hexdigest()
+
+def _fast_copy(source_file, dest_file):
+    """Copy a file in kernel space where possible, preserving metadata like shutil.copy2"""
+    try:
+        with open(source_file, 'rb') as fsrc, open(dest_file, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if not copied:
+                    # Some filesystems report EOF early, never keep a short copy
+                    raise OSError(f"copy_file_range stopped with {remaining} bytes left")
+                remaining -= copied
+    except (AttributeError, OSError):
+        # No copy_file_range (non-Linux, old kernel or cross-filesystem),
+        # shutil.copyfile still uses sendfile where available
+        shutil.copyfile(source_file, dest_file)
+    shutil.copystat(source_file, dest_file)
+
+def _find_files(source_dir, file_names):
+    """Map each wanted file name to its first match under source_dir, in os.walk order"""
+    wanted = set(file_names)
+    found = {}
+    pending = [source_dir]
+
+    while pending and len(found) < len(wanted):
+        directory = pending.pop()
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+
+                    if is_dir:
+                        # Like os.walk, don't descend into symlinked directories
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    elif entry.name in wanted:
+                        found.setdefault(entry.name, entry.path)
+        except OSError:
+            continue
+
+        # Visit subdirectories depth-first in listing order
+        pending.extend(reversed(subdirs))
+
+    return found
+
+def _copy_firmware_image(source_file, dest_file):
+    """Copy a firmware image unless the destination is identical, returns (sha1, copied)"""
+    if os.path.exists(dest_file) and os.path.getsize(dest_file) == os.path.getsize(source_file):
+        sha1_hash = calculate_sha1(dest_file)
+        if sha1_hash == calculate_sha1(source_file):
+            return sha1_hash, False
+
+    _fast_copy(source_file, dest_file)
+    return calculate_sha1(dest_file), True
 
 def extract_firmware_images(source_dir, device="pipa", vendor="xiaomi", update_mk=True):
     """
@@ -39,31 +108,25 @@ def extract_firmware_images(source_dir, device="pipa", vendor="xiaomi", update_m
     source_dir = os.path.abspath(source_dir)
     
     # Destination directory
-    vendor_dir = os.path.abspath(f"{os.path.dirname(os.path.abspath(__file__))}/../../..")
+    vendor_dir = ANDROID_ROOT
     vendor_firmware_dir = f"{vendor_dir}/vendor/{vendor}/{device}/radio"
     
     # Path to the firmware files list
-    firmware_list_path = f"{os.path.dirname(os.path.abspath(__file__))}/proprietary-firmware.txt"
+    firmware_list_path = f"{MY_DIR}/proprietary-firmware.txt"
     
     # Check if firmware list exists
     if not os.path.exists(firmware_list_path):
         print(f"Error: Firmware list not found at {firmware_list_path}")
         return False
         
-    # Read firmware list
-    firmware_files = []
+    # Read firmware list, skipping comments and empty lines
+    # Format is typically: path/to/file.img (or similar)
     with open(firmware_list_path, 'r') as f:
-        for line in f:
-            # Skip comments and empty lines
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-                
-            # Extract the filename from the line
-            # Format is typically: path/to/file.img (or similar)
-            parts = line.split()
-            if parts:
-                firmware_files.append(os.path.basename(parts[0]))
+        firmware_files = [
+            os.path.basename(entry.split()[0])
+            for line in f
+            if (entry := line.strip()) and not entry.startswith('#')
+        ]
     
     if not firmware_files:
         print(f"No firmware files specified in {firmware_list_path}")
@@ -75,17 +138,12 @@ def extract_firmware_images(source_dir, device="pipa", vendor="xiaomi", update_m
     # Find the firmware files in the source directory
     found_files = []
     missing_files = []
-    
+
+    source_index = _find_files(source_dir, firmware_files)
+
     for firmware_file in firmware_files:
-        # Search for the file in the source directory
-        matches = []
-        for root, dirs, files in os.walk(source_dir):
-            if firmware_file in files:
-                matches.append(os.path.join(root, firmware_file))
-        
-        if matches:
-            # Use the first match
-            found_files.append((matches[0], firmware_file))
+        if firmware_file in source_index:
+            found_files.append((source_index[firmware_file], firmware_file))
         else:
             missing_files.append(firmware_file)
     
@@ -100,22 +158,35 @@ def extract_firmware_images(source_dir, device="pipa", vendor="xiaomi", update_m
     
     # Copy the firmware files to vendor directory
     copied_files = []
+    skipped_files = []
     sha1_entries = []
-    
-    for source_file, filename in found_files:
-        dest_file = f"{vendor_firmware_dir}/{filename}"
-        
-        print(f"Copying {filename} to {vendor_firmware_dir}")
-        shutil.copy2(source_file, dest_file)
-        copied_files.append(filename)
-        
-        # Calculate SHA1 checksum
-        sha1_hash = calculate_sha1(dest_file)
-        sha1_entries.append((filename, sha1_hash))
-    
-    print(f"\nSuccessfully copied {len(copied_files)} firmware files:")
-    for file in copied_files:
-        print(f"  - {file}")
+
+    # Encode paths once, the copy and hash helpers open each of them several times
+    source_paths = [os.fsencode(source_file) for source_file, _ in found_files]
+    dest_paths = [os.fsencode(f"{vendor_firmware_dir}/{filename}") for _, filename in found_files]
+
+    # Copy and hash in parallel, hashlib and the copy syscalls release the GIL
+    with ThreadPoolExecutor() as executor:
+        results = executor.map(_copy_firmware_image, source_paths, dest_paths)
+
+        for (_, filename), (sha1_hash, copied) in zip(found_files, results):
+            if copied:
+                print(f"Copying {filename} to {vendor_firmware_dir}")
+                copied_files.append(filename)
+            else:
+                print(f"Skipping {filename}, already up to date in {vendor_firmware_dir}")
+                skipped_files.append(filename)
+            sha1_entries.append((filename, sha1_hash))
+
+    if copied_files:
+        print(f"\nSuccessfully copied {len(copied_files)} firmware files:")
+        for file in copied_files:
+            print(f"  - {file}")
+
+    if skipped_files:
+        print(f"\nSkipped {len(skipped_files)} firmware files already up to date:")
+        for file in skipped_files:
+            print(f"  - {file}")
     
     # Update files if requested
     if update_mk and sha1_entries:
@@ -137,6 +208,9 @@ def extract_firmware_images(source_dir, device="pipa", vendor="xiaomi", update_m
                 print(f"Creating new Android.mk at {android_mk_path}")
                 create_new_android_mk = True
         
+        radio_entries = "".join(
+            f"$(call add-radio-file-sha1-checked,radio/{filename},{sha1})\n" for filename, sha1 in sha1_entries)
+
         # Create file or add firmware entries to existing file
         if create_new_android_mk:
             # Create a new Android.mk file with our firmware entries
@@ -150,16 +224,11 @@ ifeq ($(TARGET_DEVICE),{device})
 
 """.format(vendor=vendor, device=device)
 
-            # Add all firmware entries
-            for filename, sha1 in sha1_entries:
-                mk_content += f"$(call add-radio-file-sha1-checked,radio/{filename},{sha1})\n"
-            
-            # Close the conditional
-            mk_content += "\nendif"
-            
-            # Write the file
+            # Write the file with all firmware entries and close the conditional
             with open(android_mk_path, 'w') as f:
                 f.write(mk_content)
+                f.write(radio_entries)
+                f.write("\nendif")
         else:
             # File exists and has device conditional
             # Find the position to insert the radio files
@@ -176,17 +245,12 @@ ifeq ($(TARGET_DEVICE),{device})
                 # Calculate where to insert firmware entries (after device line)
                 insert_pos = device_pos + len(device_line)
                 
-                # Build the radio files section
-                radio_section = "\n\n"
-                for filename, sha1 in sha1_entries:
-                    radio_section += f"$(call add-radio-file-sha1-checked,radio/{filename},{sha1})\n"
-                
-                # Insert the radio section
-                new_content = mk_content[:insert_pos] + radio_section + mk_content[insert_pos:]
-                
-                # Write the updated content
+                # Write the updated content with the radio section inserted
                 with open(android_mk_path, 'w') as f:
-                    f.write(new_content)
+                    f.write(mk_content[:insert_pos])
+                    f.write("\n\n")
+                    f.write(radio_entries)
+                    f.write(mk_content[insert_pos:])
             else:
                 print(f"Error: Malformed Android.mk - creating new one")
                 # Create a new file as fallback
@@ -200,16 +264,11 @@ ifeq ($(TARGET_DEVICE),{device})
 
 """.format(vendor=vendor, device=device)
 
-                # Add all firmware entries
-                for filename, sha1 in sha1_entries:
-                    mk_content += f"$(call add-radio-file-sha1-checked,radio/{filename},{sha1})\n"
-                
-                # Close the conditional
-                mk_content += "\nendif"
-                
-                # Write the file
+                # Write the file with all firmware entries and close the conditional
                 with open(android_mk_path, 'w') as f:
                     f.write(mk_content)
+                    f.write(radio_entries)
+                    f.write("\nendif")
         
         print(f"\nUpdated {android_mk_path} with firmware SHA1 checksums")
         
@@ -235,11 +294,7 @@ AB_OTA_PARTITIONS += \\
 """.format(vendor=vendor, device=device)
 
             # Add all partitions
-            for partition in sorted(partition_names):
-                if partition == sorted(partition_names)[-1]:  # Last item
-                    board_content += f"    {partition}"
-                else:
-                    board_content += f"    {partition} \\\n"
+            board_content += " \\\n".join(f"    {partition}" for partition in sorted(partition_names))
             
             # Write the file
             with open(board_config_path, 'w') as f:
@@ -252,48 +307,28 @@ AB_OTA_PARTITIONS += \\
                 board_content = f.read()
             
             # Check if AB_OTA_PARTITIONS already exists
-            ab_ota_match = re.search(r'AB_OTA_PARTITIONS \+= \\(.*?)(?=\n\n|\n[^\s]|\Z)', board_content, re.DOTALL)
-            
+            ab_ota_match = AB_OTA_PARTITIONS_RE.search(board_content)
+
             if ab_ota_match:
-                # Get existing content
-                existing_content = ab_ota_match.group(1)
-                
                 # Check which partitions are already listed
-                existing_partitions = []
-                for line in existing_content.split('\n'):
-                    line = line.strip()
-                    if line and not line.endswith('\\'):  # Last line won't have continuation
-                        existing_partitions.append(line)
-                    elif line:  # Has continuation
-                        existing_partitions.append(line[:-1].strip())
-                
-                # Filter out partitions that already exist
-                new_partitions = [p for p in partition_names if p not in existing_partitions]
-                
-                if new_partitions:
+                existing_partitions = set(AB_OTA_ENTRY_RE.findall(ab_ota_match.group(1)))
+
+                if not existing_partitions.issuperset(partition_names):
                     # Build the new section
-                    new_section = "AB_OTA_PARTITIONS += \\"
-                    for partition in sorted(existing_partitions + new_partitions):
-                        new_section += f"\n    {partition} \\"
-                    
-                    # Remove trailing backslash from the last line
-                    new_section = new_section[:-2]
-                    
+                    new_section = "AB_OTA_PARTITIONS += \\\n" + " \\\n".join(
+                        f"    {partition}" for partition in sorted(existing_partitions.union(partition_names)))
+
                     # Replace the old section
-                    board_content = board_content.replace(ab_ota_match.group(0), new_section)
-                    
                     with open(board_config_path, 'w') as f:
-                        f.write(board_content)
-                    
+                        f.write(board_content[:ab_ota_match.start()])
+                        f.write(new_section)
+                        f.write(board_content[ab_ota_match.end():])
+
                     print(f"Updated {board_config_path} with new partitions")
             else:
                 # AB_OTA_PARTITIONS doesn't exist in the file, add it
-                new_section = "\nAB_OTA_PARTITIONS += \\"
-                for partition in sorted(partition_names):
-                    if partition == sorted(partition_names)[-1]:  # Last item
-                        new_section += f"\n    {partition}"
-                    else:
-                        new_section += f"\n    {partition} \\"
+                new_section = "\nAB_OTA_PARTITIONS += \\\n" + " \\\n".join(
+                    f"    {partition}" for partition in sorted(partition_names))
                 
                 # Add to the end of the file
                 with open(board_config_path, 'a') as f:
@@ -303,17 +338,24 @@ AB_OTA_PARTITIONS += \\
     
     return True
 
-if __name__ == "__main__":
+@functools.lru_cache(maxsize=1)
+def _build_parser():
     parser = argparse.ArgumentParser(description='Extract firmware files from ROM image')
     parser.add_argument('source', nargs='?', help='Path to extracted ROM directory')
     parser.add_argument('--no-mk-update', action='store_true', help='Do not update Android.mk')
-    
-    args = parser.parse_args()
-    
+    return parser
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+
     if not args.source:
         parser.print_help()
         print("\nError: Source directory is required")
-        sys.exit(1)
-    
+        return 1
+
     success = extract_firmware_images(args.source, update_mk=not args.no_mk_update)
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())